@@ -65,16 +65,13 @@ class AgentChain(BaseModel):
                 logging.info("Running code block:\n%s", block.name)
                 response = block.invoke(prompt)
                 prompt[block.name] = response
+                args = block.args
                 execution_steps.append(
                     ChainExecution(
                         step=ChainExecutionStep.TOOL,
                         content=ChainExecutionTool(
                             name=block.name,
-                            args=(
-                                None
-                                if block.args is None
-                                else {key: prompt.get(key) for key in prompt if key in block.args}
-                            ),
+                            args=None if args is None else {key: prompt.get(key) for key in prompt if key in args},
                             response=response,
                         ),
                     )
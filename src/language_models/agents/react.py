@@ -4,14 +4,18 @@ from __future__ import annotations
 
 import json
 import logging
+import threading
+from collections import OrderedDict
 from enum import Enum
+from functools import lru_cache
 from typing import Any, Type
 
+import orjson
 import tiktoken
 from pydantic import BaseModel, ValidationError
 
 from language_models.models.llm import ChatMessage, ChatMessageRole, OpenAILanguageModel
-from language_models.tools.tool import Tool
+from language_models.tools.tool import Tool, _schema_properties
 
 logging.basicConfig(
     level=logging.INFO,
@@ -49,18 +53,70 @@ When you know the answer, you MUST use the following JSON format:
 }}"""
 
 
+_NUM_TOKENS_CACHE_MAX_CHARS = 1_000_000
+_NUM_TOKENS_CACHE: OrderedDict[str, int] = OrderedDict()
+_NUM_TOKENS_CACHE_CHARS = 0
+_NUM_TOKENS_CACHE_LOCK = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(encoding_name: str = "cl100k_base") -> tiktoken.Encoding:
+    """Loads a tiktoken encoding once per process."""
+    return tiktoken.get_encoding(encoding_name)
+
+
+def _loads(response: str) -> Any:
+    """Decodes JSON with orjson and falls back to json for control characters, which orjson rejects in strings."""
+    try:
+        return orjson.loads(response)
+    except orjson.JSONDecodeError:
+        return json.loads(response, strict=False)
+
+
+def num_tokens_per_message(messages: list[ChatMessage]) -> list[int]:
+    """Counts the number of tokens of each message.
+
+    The agent rewrites the content of the last message on every iteration, so it is always encoded. The roles and the
+    contents of the other messages are kept in an LRU cache, bounded by the number of cached characters, and only
+    those that were not counted before are encoded. Texts are encoded one at a time, so only the token list of a
+    single text is alive at once.
+    """
+    global _NUM_TOKENS_CACHE_CHARS
+    if not messages:
+        return []
+    *stable_messages, last_message = messages
+    counts = {}
+    uncached = []
+    with _NUM_TOKENS_CACHE_LOCK:
+        for value in {value for message in stable_messages for value in (message.role, message.content)}:
+            count = _NUM_TOKENS_CACHE.get(value)
+            if count is None:
+                uncached.append(value)
+            else:
+                _NUM_TOKENS_CACHE.move_to_end(value)
+                counts[value] = count
+    if last_message.role not in counts and last_message.role not in uncached:
+        uncached.append(last_message.role)
+    encoding = _get_encoding()
+    num_last_tokens = len(encoding.encode_ordinary(last_message.content))
+    new_counts = {value: len(encoding.encode_ordinary(value)) for value in uncached}
+    with _NUM_TOKENS_CACHE_LOCK:
+        for value, count in new_counts.items():
+            if value not in _NUM_TOKENS_CACHE:
+                _NUM_TOKENS_CACHE_CHARS += len(value)
+            _NUM_TOKENS_CACHE[value] = count
+        while _NUM_TOKENS_CACHE_CHARS > _NUM_TOKENS_CACHE_MAX_CHARS:
+            value, _ = _NUM_TOKENS_CACHE.popitem(last=False)
+            _NUM_TOKENS_CACHE_CHARS -= len(value)
+    counts.update(new_counts)
+    tokens_per_message = [4 + counts[message.role] + counts[message.content] for message in stable_messages]
+    tokens_per_message.append(4 + counts[last_message.role] + num_last_tokens)
+    return tokens_per_message
+
+
 def num_tokens_from_messages(messages: list[ChatMessage]) -> int:
     """Counts the number of tokens in the conversation history."""
-    encoding = tiktoken.get_encoding("cl100k_base")
-    num_tokens = 0
-    for message in messages:
-        num_tokens += 4
-        for key, value in message.model_dump().items():
-            num_tokens += len(encoding.encode(value))
-            if key == "name":
-                num_tokens += -1
-    num_tokens += 2
-    return num_tokens
+    return sum(num_tokens_per_message(messages)) + 2
 
 
 class LLMCoTStep(str, Enum):
@@ -106,6 +162,26 @@ class ReActAgent(BaseModel):
     output_format: Type[BaseModel]
     chat_messages: list[ChatMessage]
     iterations: int = 20
+    _tool_names: str = ""
+    _num_system_tokens: int = 0
+    _format_error: str = ""
+
+    def model_post_init(self, __context: Any) -> None:
+        """Precomputes the tool names, the format error observation and the token count of the system prompt."""
+        self._tool_names = "" if self.tools is None else ", ".join(self.tools)
+        self._format_error = (
+            "Your response format was incorrect."
+            + " Look at the JSON format below and correct your answer."
+            + "\n\nPlease ALWAYS use the following JSON format:"
+            + '\n{\n  "thought": "Explain your thought. Consider previous and subsequent steps",'
+            + f'\n  "tool": "The tool to use. Must be one of {self._tool_names}",'
+            + '\n  "tool_input": "Valid keyword arguments (e.g. {"key": value})"\n}'
+            + "\n\nWhen you know the answer, you MUST use the following JSON format:"
+            + '\n{\n  "thought": "Explain the reason of your final answer when you know what to respond",'
+            + '\n  "tool": "Final Answer",'
+            + '\n  "tool_input": "Valid keyword arguments (e.g. {"key": value})"\n}'
+        )
+        self._num_system_tokens = sum(num_tokens_per_message(self.chat_messages[:1]))
 
     def reset(self) -> None:
         """Resets the ReAct agent."""
@@ -113,32 +189,24 @@ class ReActAgent(BaseModel):
 
     def _trim_conversation(self) -> None:
         """Trims the chat messages to fit the LLM context length."""
-        num_tokens = num_tokens_from_messages(self.chat_messages)
-        while num_tokens + self.llm.max_tokens >= _MODEL_TOKEN_LIMIT[self.llm.model]:
-            del self.chat_messages[1]
-            num_tokens = num_tokens_from_messages(self.chat_messages)
+        tokens_per_message = [self._num_system_tokens] + num_tokens_per_message(self.chat_messages[1:])
+        num_tokens = sum(tokens_per_message) + 2
+        num_removed = 0
+        limit = _MODEL_TOKEN_LIMIT[self.llm.model] - self.llm.max_tokens
+        while num_tokens >= limit:
+            num_removed += 1
+            num_tokens -= tokens_per_message[num_removed]
+        del self.chat_messages[1 : num_removed + 1]
 
     def _parse_response(self, response: str) -> tuple:
         """Parses the LLM response."""
         try:
-            response = json.loads(response, strict=False)
+            response = _loads(response)
             response = LLMResponse.model_validate(response)
             observation = None
         except json.decoder.JSONDecodeError:
             response = None
-            tool_names = ", ".join(list(self.tools.keys()))
-            observation = (
-                "Your response format was incorrect."
-                + " Look at the JSON format below and correct your answer."
-                + "\n\nPlease ALWAYS use the following JSON format:"
-                + '\n{\n  "thought": "Explain your thought. Consider previous and subsequent steps",'
-                + f'\n  "tool": "The tool to use. Must be one of {tool_names}",'
-                + '\n  "tool_input": "Valid keyword arguments (e.g. {"key": value})"\n}'
-                + "\n\nWhen you know the answer, you MUST use the following JSON format:"
-                + '\n{\n  "thought": "Explain the reason of your final answer when you know what to respond",'
-                + '\n  "tool": "Final Answer",'
-                + '\n  "tool_input": "Valid keyword arguments (e.g. {"key": value})"\n}'
-            )
+            observation = self._format_error
         except ValidationError as e:
             response = None
             observation = f"Your response failed validation. The error was: {e}"
@@ -146,8 +214,10 @@ class ReActAgent(BaseModel):
 
     def invoke(self, prompt: dict[str, Any]) -> AgentResponse:
         """Runs the AI agent."""
-        previous_work = []
-        prompt = self.task_prompt.format(**{variable: prompt.get(variable) for variable in self.task_prompt_variables})
+        previous_work = ""
+        prompt = self.task_prompt.format_map(
+            {variable: prompt.get(variable) for variable in self.task_prompt_variables}
+        )
         logging.info("Prompt:\n%s", prompt)
         self.chat_messages.append(ChatMessage(role=ChatMessageRole.USER, content=prompt))
         chain_of_thought: list[LLMCoT] = [LLMCoT(step=LLMCoTStep.PROMPT, content=prompt)]
@@ -159,7 +229,7 @@ class ReActAgent(BaseModel):
             response, observation = self._parse_response(response)
             if response is not None:
                 logging.info("Thought:\n%s", response.thought)
-                previous_work.append(f"Thought: {response.thought}")
+                previous_work += f"\nThought: {response.thought}"
                 chain_of_thought.append(LLMCoT(step=LLMCoTStep.THOUGHT, content=response.thought))
                 if response.tool == "Final Answer":
                     try:
@@ -186,8 +256,7 @@ class ReActAgent(BaseModel):
                             tool_response = tool.invoke(response.tool_input)
                             observation = f"Tool response:\n{tool_response}"
                             logging.info(observation)
-                            previous_work.append(f"Tool: {tool.name}")
-                            previous_work.append(f"Tool input: {response.tool_input}")
+                            previous_work += f"\nTool: {tool.name}\nTool input: {response.tool_input}"
                             chain_of_thought.append(
                                 LLMCoT(
                                     step=LLMCoTStep.TOOL,
@@ -199,14 +268,15 @@ class ReActAgent(BaseModel):
                                 )
                             )
                         else:
-                            tool_names = ", ".join(list(self.tools.keys()))
-                            observation = f"{response.tool} tool doesn't exist. Try one of these tools: {tool_names}"
-            previous_work.append(f"Observation: {observation}")
-            self.chat_messages[-1].content = prompt + "\n\nThis was your previous work:\n\n" + "\n".join(previous_work)
+                            observation = (
+                                f"{response.tool} tool doesn't exist. Try one of these tools: {self._tool_names}"
+                            )
+            previous_work += f"\nObservation: {observation}"
+            self.chat_messages[-1].content = prompt + "\n\nThis was your previous work:\n" + previous_work
             iterations += 1
         return AgentResponse(
             prompt=prompt,
-            final_answer={key: None for key in self.output_format.model_json_schema()["properties"]},
+            final_answer=dict.fromkeys(_schema_properties(self.output_format)),
             chain_of_thought=[step.model_dump() for step in chain_of_thought],
         )
 
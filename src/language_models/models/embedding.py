@@ -1,9 +1,22 @@
 """Sentence transformer embeddings."""
 
+from functools import lru_cache
+
+import numpy as np
 from pydantic import BaseModel
 from sentence_transformers import SentenceTransformer
 
-_MODEL = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+
+@lru_cache(maxsize=None)
+def _load_model(model: str) -> SentenceTransformer:
+    """Loads a sentence transformer once per process, instances with the same model share its weights."""
+    return SentenceTransformer(model)
+
+
+@lru_cache(maxsize=1024)
+def _embed_query(model: str, query: str) -> tuple[float, ...]:
+    """Embeds a query once, repeated queries are answered from the cache."""
+    return tuple(_load_model(model).encode(query.replace("\n", " "), show_progress_bar=False).tolist())
 
 
 class SentenceTransformerEmbeddingModel(BaseModel):
@@ -11,18 +24,19 @@ class SentenceTransformerEmbeddingModel(BaseModel):
 
     model: str = "all-MiniLM-L6-v2"
 
-    def embed_texts(self, texts: list[str]) -> list[list[float]]:
+    def embed_texts(self, texts: list[str], as_list: bool = True) -> list[list[float]] | np.ndarray:
         """Compute doc embeddings using a HuggingFace transformer model.
 
         Args:
             texts: The list of texts to embed.
+            as_list: Whether to convert the embeddings to lists, otherwise the encoded array is returned.
 
         Returns:
-            List of embeddings, one for each text.
+            List of embeddings, one for each text, or an array of shape (len(texts), dimension) if as_list is False.
         """
-        texts = list(map(lambda x: x.replace("\n", " "), texts))
-        embeddings = _MODEL.encode(texts, show_progress_bar=False)
-        return embeddings.tolist()
+        texts = [text.replace("\n", " ") for text in texts]
+        embeddings = _load_model(self.model).encode(texts, show_progress_bar=False)
+        return embeddings.tolist() if as_list else embeddings
 
     def embed_query(self, query: str) -> list[float]:
         """Compute query embeddings using a HuggingFace transformer model.
@@ -33,4 +47,4 @@ class SentenceTransformerEmbeddingModel(BaseModel):
         Returns:
             Embedding for the query.
         """
-        return self.embed_texts([query])[0]
+        return list(_embed_query(self.model, query))
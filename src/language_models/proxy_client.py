@@ -1,9 +1,10 @@
 """BTP proxy client."""
 
+import threading
 from datetime import datetime, timedelta, timezone
 
 import requests
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 from tenacity import (
     retry,
     retry_if_exception_type,
@@ -22,8 +23,9 @@ class BTPProxyClient(BaseModel):
     auth_url: str
     api_base: str
     _access_token: str | None = None
-    _access_token_expiry: str | None = None
+    _access_token_expiry: datetime | None = None
     _headers: dict[str, str] = {"Content-Type": "application/json"}
+    _token_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
 
     def _fetch_access_token(self) -> None:
         """Fetches the access token."""
@@ -49,10 +51,21 @@ class BTPProxyClient(BaseModel):
         """Checks if the access token exists or has expired."""
         current_time = datetime.now(timezone.utc)
         return (self._access_token is None) or (
-            current_time - self._access_token_expiry
+            self._access_token_expiry - current_time
             < timedelta(minutes=settings.API_ACCESS_TOKEN_EXPIRY_MINUTES)
         )
 
+    def _get_headers(self, refresh: bool = False) -> dict[str, str]:
+        """Gets the request headers and fetches an access token if needed.
+
+        The token is checked and fetched under a lock, so concurrent requests
+        sharing the client never see a half-updated token or headers.
+        """
+        with self._token_lock:
+            if refresh or self._access_token_expired_or_missing():
+                self._fetch_access_token()
+            return dict(self._headers)
+
     @retry(
         stop=stop_after_attempt(settings.API_MAX_RETRIES),
         wait=wait_exponential(
@@ -76,20 +89,19 @@ class BTPProxyClient(BaseModel):
         Raises:
             RequestException: An error that occurred while handling the API request.
         """
-        if self._access_token_expired_or_missing():
-            self._fetch_access_token()
+        headers = self._get_headers()
         try:
             response = requests.post(
                 f"{self.api_base}/api/v1/{api_endpoint}",
-                headers=self._headers,
+                headers=headers,
                 json=data,
                 timeout=settings.API_REQUEST_TIMEOUT_SECONDS,
             )
             if response.status_code in (401, 403):
-                self._fetch_access_token()
+                headers = self._get_headers(refresh=True)
                 response = requests.post(
                     api_endpoint,
-                    headers=self._headers,
+                    headers=headers,
                     json=data,
                     timeout=settings.API_REQUEST_TIMEOUT_SECONDS,
                 )
@@ -1,5 +1,7 @@
 """Contextual compression retriever."""
 
+from concurrent.futures import ThreadPoolExecutor
+
 from langchain_core.documents import Document
 from pydantic import BaseModel
 
@@ -26,32 +28,36 @@ class ContextualCompressionRetriever(BaseModel):
     llm: OpenAILanguageModel
     vector_store: FAISSVectorStore
     score_threshold: float = 0.0
+    max_workers: int = 4
 
     def _parse_output(self, output: str) -> bool:
         """Parses LLM output."""
         cleaned_upper_text = output.strip().upper()
-        if "YES" in cleaned_upper_text and "NO" in cleaned_upper_text:
+        has_yes = "YES" in cleaned_upper_text
+        has_no = "NO" in cleaned_upper_text
+        if has_yes and has_no:
             raise ValueError(f"Ambiguous response. Both 'YES' and 'NO' in received: {output}.")
-        elif "YES" in cleaned_upper_text:
+        elif has_yes:
             return True
-        elif "NO" in cleaned_upper_text:
+        elif has_no:
             return False
         else:
             raise ValueError(f"Expected output value to include either 'YES' or 'NO'. Received {output}.")
 
+    def _is_relevant(self, user_text: str, document: Document) -> bool:
+        """Asks the LLM whether a document is relevant to the user text."""
+        prompt = _PROMPT_TEMPLATE.format(question=user_text, context=document.page_content)
+        output = self.llm.get_completion([ChatMessage(role=ChatMessageRole.USER, content=prompt)])
+        try:
+            return self._parse_output(output)
+        except ValueError:
+            return False
+
     def _compress_documents(self, user_text: str, documents: list[Document]) -> list[Document]:
-        """Filters relevant documents."""
-        compressed_documents = []
-        for document in documents:
-            prompt = _PROMPT_TEMPLATE.format(question=user_text, context=document.page_content)
-            output = self.llm.get_completion([ChatMessage(role=ChatMessageRole.USER, content=prompt)])
-            try:
-                include_doc = self._parse_output(output)
-            except ValueError:
-                include_doc = False
-            if include_doc:
-                compressed_documents.append(document)
-        return compressed_documents
+        """Filters relevant documents, running the independent LLM relevance checks concurrently."""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            include_docs = list(executor.map(lambda document: self._is_relevant(user_text, document), documents))
+        return [document for document, include_doc in zip(documents, include_docs) if include_doc]
 
     def get_relevant_documents(self, user_text: str, fetch_k: int = 5) -> str:
         """Gets relevant documents."""
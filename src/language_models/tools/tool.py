@@ -1,11 +1,21 @@
 """LLM tool."""
 
-import re
+import copy
+from functools import lru_cache
 from typing import Any, Callable, Type
 
 from pydantic import BaseModel, ValidationError
 
 
+@lru_cache(maxsize=None)
+def _schema_properties(model: Type[BaseModel]) -> dict:
+    """Gets the JSON schema properties of a model class.
+
+    The result is shared by every caller of the same class and must not be mutated.
+    """
+    return model.model_json_schema()["properties"]
+
+
 class Tool(BaseModel):
     """Class that implements an LLM tool."""
 
@@ -18,14 +28,14 @@ class Tool(BaseModel):
     def args(self) -> dict | None:
         if self.args_schema is None:
             return
-        return self.args_schema.model_json_schema()["properties"]
+        return copy.deepcopy(_schema_properties(self.args_schema))
 
     def __str__(self) -> str:
         args = self.args
         return (
             f"- tool name: {self.name}, "
             f"tool description: {self.description}, "
-            f"tool input: {re.sub('}', '}}', re.sub('{', '{{', str(args)))}"
+            f"tool input: {str(args).replace('{', '{{').replace('}', '}}')}"
         )
 
     def _parse_input(self, tool_input: dict[str, Any]) -> dict[str, Any]:
@@ -33,7 +43,7 @@ class Tool(BaseModel):
         input_args = self.args_schema
         if input_args is not None:
             result = input_args.model_validate(tool_input)
-            return {key: getattr(result, key) for key, _ in result.model_dump().items() if key in tool_input}
+            return {key: getattr(result, key) for key in input_args.model_fields if key in tool_input}
         return tool_input
 
     def invoke(self, tool_input: dict[str, Any]) -> Any:
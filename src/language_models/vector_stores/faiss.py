@@ -44,8 +44,8 @@ class FAISSVectorStore(BaseModel):
     def add_documents(self, documents: list[Document]) -> None:
         """Adds documents to the FAISS index."""
         texts = [document.page_content for document in documents]
-        embeddings = self.embedding_model.embed_texts(texts)
-        vectors = np.array(embeddings, dtype=np.float32)
+        embeddings = self.embedding_model.embed_texts(texts, as_list=False)
+        vectors = np.asarray(embeddings, dtype=np.float32)
         if self.index is None:
             if self.distance_metric == DistanceMetric.EUCLIDEAN_DISTANCE:
                 self.index = faiss.IndexFlatL2(vectors.shape[1])
@@ -64,8 +64,8 @@ class USGeopoliticalSurveyEarthquakeAPI(BaseModel):
 
 
 def query_earthquakes(
-    start_time: datetime = (datetime.now() - timedelta(days=30)).date(),
-    end_time: datetime = datetime.now().date(),
+    start_time: datetime | None = None,
+    end_time: datetime | None = None,
     limit: int = 20000,
     min_depth: int = -100,
     max_depth: int = 1000,
@@ -73,6 +73,10 @@ def query_earthquakes(
     max_magnitude: int | None = None,
     alert_level: str | None = None,
 ) -> Any:
+    if start_time is None:
+        start_time = (datetime.now() - timedelta(days=30)).date()
+    if end_time is None:
+        end_time = datetime.now().date()
     params = {
         "format": "geojson",
         "starttime": start_time,
@@ -94,8 +98,8 @@ def query_earthquakes(
 
 
 def count_earthquakes(
-    start_time: datetime = (datetime.now() - timedelta(days=30)).date(),
-    end_time: datetime = datetime.now().date(),
+    start_time: datetime | None = None,
+    end_time: datetime | None = None,
     limit: int = 20000,
     min_depth: int = -100,
     max_depth: int = 1000,
@@ -103,6 +107,10 @@ def count_earthquakes(
     max_magnitude: int | None = None,
     alert_level: str | None = None,
 ) -> int:
+    if start_time is None:
+        start_time = (datetime.now() - timedelta(days=30)).date()
+    if end_time is None:
+        end_time = datetime.now().date()
     params = {
         "format": "geojson",
         "starttime": start_time,
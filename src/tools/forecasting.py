@@ -1,12 +1,18 @@
 """Forecasting tool."""
 
 import os
+import time
 from datetime import datetime, timedelta
+from functools import lru_cache
 from urllib import parse
 
 import catboost as cb
+import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
 
+_CACHE_TTL_SECONDS = 300
+_EARTHQUAKES_CACHE: dict[str, tuple[float, pd.DataFrame]] = {}
 _START_LAG = 3
 _END_LAG = 10
 _MEDIAN_LATITUDE = {
@@ -66,8 +72,8 @@ _MEDIAN_LONGITUDE = {
 
 
 def get_recent_earthquakes(
-    start_time: datetime = (datetime.now() - timedelta(days=30)).date(),
-    end_time: datetime = datetime.now().date(),
+    start_time: datetime | None = None,
+    end_time: datetime | None = None,
     limit: int = 20000,
     min_depth: int = -100,
     max_depth: int = 1000,
@@ -75,6 +81,14 @@ def get_recent_earthquakes(
     max_magnitude: int | None = None,
     alert_level: str | None = None,
 ) -> pd.DataFrame:
+    """Gets recent earthquakes from the USGS API.
+
+    The last response is cached for a few minutes, callers get a copy they are free to modify.
+    """
+    if start_time is None:
+        start_time = (datetime.now() - timedelta(days=30)).date()
+    if end_time is None:
+        end_time = datetime.now().date()
     params = {
         "format": "csv",
         "starttime": start_time,
@@ -91,14 +105,25 @@ def get_recent_earthquakes(
     if alert_level is not None:
         params["alertlevel"] = alert_level
     url = "https://earthquake.usgs.gov/fdsnws/event/1/query?" + parse.urlencode(params)
-    return pd.read_csv(url)
+    now = time.monotonic()
+    cached = _EARTHQUAKES_CACHE.get(url)
+    if cached is not None and now - cached[0] < _CACHE_TTL_SECONDS:
+        return cached[1].copy()
+    df = pd.read_csv(url, usecols=["time", "place", "depth", "mag"])
+    _EARTHQUAKES_CACHE.clear()
+    _EARTHQUAKES_CACHE[url] = (now, df)
+    return df.copy()
+
+
+def extract_regions(place: pd.Series) -> pd.Series:
+    """Extracts the region, i.e. the second comma-separated part, from the USGS place names."""
+    region = place.str.extract(r", (.*?)(?:, |$)", expand=False)
+    region = region.fillna(place)
+    return region.replace({"CA": "California", "B.C.": "Baja California"})
 
 
 def get_regions() -> list[str]:
     df = get_recent_earthquakes()
-    df["region"] = df.place.str.split(", ", expand=True)[1]
-    df.region = df.region.fillna(df.place)
-    df.region = df.region.replace({"CA": "California", "B.C.": "Baja California"})
     return set(
         [
             "California",
@@ -127,9 +152,10 @@ def get_regions() -> list[str]:
             "Wyoming",
             "Turkey",
         ]
-    ) & set(df.region.unique())
+    ) & set(extract_regions(df.place).unique())
 
 
+@lru_cache(maxsize=1)
 def load_model() -> cb.CatBoostRegressor:
     path = os.path.join(os.path.dirname(__file__), "./earthquake_forecasting_model")
     model = cb.CatBoostRegressor(cat_features=["region"])
@@ -146,25 +172,22 @@ def reindex(group, delta):
 
 
 def preprocess_data(df: pd.DataFrame, region: str | None = None) -> pd.DataFrame:
-    df = df.copy()
-
-    df["region"] = df.place.str.split(", ", expand=True)[1]
-    df.region = df.region.fillna(df.place)
-    df.region = df.region.replace({"CA": "California", "B.C.": "Baja California"})
-
-    df.time = pd.to_datetime(df.time)
-    df.time = df.time.dt.tz_localize(None)
+    # Build a new frame from the used columns only, the earthquakes frame is cached and must not be mutated.
+    df = pd.DataFrame(
+        {
+            "time": pd.to_datetime(df.time, format="ISO8601").dt.tz_localize(None),
+            "depth": df.depth,
+            "mag": df.mag,
+            "region": extract_regions(df.place),
+        }
+    )
     df = df.sort_values("time")
     df = df.set_index("time")
 
-    df = df[["depth", "mag", "region"]]
-
-    df = df.groupby("region").resample("d").mean().reset_index()
-    df = df.set_index("time")
-
     if region is None:
         regions = get_regions()
         df = df.loc[df.region.isin(regions)]
+        df = df.groupby(["region", pd.Grouper(freq="d")]).mean().reset_index("region")
         df = (
             df.groupby("region")[["region", "mag", "depth"]]
             .apply(lambda group: reindex(group, 0), include_groups=False)
@@ -173,7 +196,9 @@ def preprocess_data(df: pd.DataFrame, region: str | None = None) -> pd.DataFrame
         df.mag = df.groupby("region").mag.ffill()
         df.depth = df.groupby("region").depth.ffill()
     else:
-        df = df.loc[df.region == region]
+        df = df.loc[df.region == region, ["depth", "mag"]]
+        df = df.resample("d").mean()
+        df["region"] = region
         start_date = df.index.min()
         end_date = pd.Timestamp(datetime.today().date())
         date_range = pd.date_range(start=start_date, end=end_date, freq="d")
@@ -185,9 +210,63 @@ def preprocess_data(df: pd.DataFrame, region: str | None = None) -> pd.DataFrame
     return df
 
 
-def create_features(df: pd.DataFrame, region: str | None) -> pd.DataFrame:
-    df = df.copy()
+def create_date_features(index: pd.DatetimeIndex) -> pd.DataFrame:
+    """Creates the calendar features from a single conversion of the index to days."""
+    days = index.to_numpy().astype("datetime64[D]")
+    return pd.DataFrame(
+        {
+            "day": (days - days.astype("datetime64[M]")).astype(np.int64) + 1,
+            # 1970-01-01 was a Thursday, i.e. day 3 of a week that starts on Monday.
+            "dayofweek": (days.astype(np.int64) + 3) % 7,
+            "dayofyear": (days - days.astype("datetime64[Y]")).astype(np.int64) + 1,
+        },
+        index=index,
+    )
+
+
+def create_lag_features(df: pd.DataFrame) -> pd.DataFrame:
+    """Creates the magnitude and depth lags of each region in a single pass.
+
+    Rows of a region are expected to be contiguous and sorted by time.
+    """
+    values = df[["mag", "depth"]].to_numpy(dtype=np.float64)
+    codes = pd.factorize(df.region)[0]
+    mag_lags = {}
+    depth_lags = {}
+    for i in range(_START_LAG, _END_LAG + 1):
+        lagged = np.full_like(values, np.nan)
+        lagged[i:] = values[:-i]
+        lagged[i:][codes[i:] != codes[:-i]] = np.nan
+        mag_lags[f"mag_lag_{i}"] = lagged[:, 0]
+        depth_lags[f"depth_lag_{i}"] = lagged[:, 1]
+    return pd.DataFrame({**mag_lags, **depth_lags}, index=df.index)
+
+
+def create_rolling_features(df: pd.DataFrame) -> pd.DataFrame:
+    """Creates the rolling means and standard deviations of magnitude and depth of each region.
+
+    Rows of a region are expected to be contiguous and sorted by time.
+    """
+    values = df[["mag", "depth"]].to_numpy(dtype=np.float64)
+    codes = pd.factorize(df.region)[0]
+    features = {}
+    for window in (_START_LAG, _END_LAG):
+        mean = np.full_like(values, np.nan)
+        std = np.full_like(values, np.nan)
+        if len(values) >= window:
+            windows = sliding_window_view(values, window, axis=0)
+            crosses_region = codes[window - 1 :] != codes[: len(codes) - window + 1]
+            mean[window - 1 :] = windows.mean(axis=-1)
+            std[window - 1 :] = windows.std(axis=-1, ddof=1)
+            mean[window - 1 :][crosses_region] = np.nan
+            std[window - 1 :][crosses_region] = np.nan
+        for i, column in enumerate(("mag", "depth")):
+            features[f"{column}_rolling_mean_{window}"] = mean[:, i]
+            features[f"{column}_rolling_std_{window}"] = std[:, i]
+    return pd.DataFrame(features, index=df.index)
 
+
+def create_features(df: pd.DataFrame, region: str | None) -> pd.DataFrame:
     if region is None:
         regions = get_regions()
         df = df.loc[df.region.isin(regions)]
@@ -203,37 +282,7 @@ def create_features(df: pd.DataFrame, region: str | None) -> pd.DataFrame:
         df = df.reindex(date_range)
         df.region = df.region.ffill()
 
-    df["day"] = df.index.day
-    df["dayofweek"] = df.index.dayofweek
-    df["dayofyear"] = df.index.dayofyear
-
-    for i in range(_START_LAG, _END_LAG + 1):
-        df[f"mag_lag_{i}"] = df.groupby("region").mag.shift(i)
-
-    for i in range(_START_LAG, _END_LAG + 1):
-        df[f"depth_lag_{i}"] = df.groupby("region").depth.shift(i)
-
-    df[f"mag_rolling_mean_{_START_LAG}"] = df.groupby("region").mag.transform(
-        lambda x: x.rolling(window=_START_LAG).mean()
-    )
-    df[f"mag_rolling_std_{_START_LAG}"] = df.groupby("region").mag.transform(
-        lambda x: x.rolling(window=_START_LAG).std()
-    )
-    df[f"depth_rolling_mean_{_START_LAG}"] = df.groupby("region").depth.transform(
-        lambda x: x.rolling(window=_START_LAG).mean()
-    )
-    df[f"depth_rolling_std_{_START_LAG}"] = df.groupby("region").depth.transform(
-        lambda x: x.rolling(window=_START_LAG).std()
-    )
-
-    df[f"mag_rolling_mean_{_END_LAG}"] = df.groupby("region").mag.transform(lambda x: x.rolling(window=_END_LAG).mean())
-    df[f"mag_rolling_std_{_END_LAG}"] = df.groupby("region").mag.transform(lambda x: x.rolling(window=_END_LAG).std())
-    df[f"depth_rolling_mean_{_END_LAG}"] = df.groupby("region").depth.transform(
-        lambda x: x.rolling(window=_END_LAG).mean()
-    )
-    df[f"depth_rolling_std_{_END_LAG}"] = df.groupby("region").depth.transform(
-        lambda x: x.rolling(window=_END_LAG).std()
-    )
+    df = pd.concat([df, create_date_features(df.index), create_lag_features(df), create_rolling_features(df)], axis=1)
 
     return df
 
@@ -261,20 +310,24 @@ def get_forecast(region: str | None = None) -> pd.DataFrame:
         + [f"depth_lag_{i}" for i in range(_START_LAG, _END_LAG + 1)]
     )
     cat_features = ["region"]
+    date = pd.Timestamp.now() - pd.Timedelta(days=7)
+    df = df.loc[df.index >= date]
     forecast = model.predict(df[features + cat_features])
-    df_forecast = pd.DataFrame(forecast, columns=["Magnitude Forecast", "Depth Forecast"])
-    df = df.reset_index()
-    df = df.join(df_forecast)
-    df = df[["index", "mag", "Magnitude Forecast", "depth", "Depth Forecast", "region"]]
-    df["Latitude"] = df.region.map(_MEDIAN_LATITUDE)
-    df["Longitude"] = df.region.map(_MEDIAN_LONGITUDE)
-    df = df.rename(
-        columns={
-            "index": "Date",
-            "mag": "Magnitude",
-            "depth": "Depth",
-            "region": "Region",
+    if region is None:
+        latitude = df.region.map(_MEDIAN_LATITUDE).to_numpy()
+        longitude = df.region.map(_MEDIAN_LONGITUDE).to_numpy()
+    else:
+        latitude = _MEDIAN_LATITUDE.get(region, np.nan)
+        longitude = _MEDIAN_LONGITUDE.get(region, np.nan)
+    return pd.DataFrame(
+        {
+            "Date": df.index,
+            "Magnitude": df.mag.to_numpy(),
+            "Magnitude Forecast": forecast[:, 0],
+            "Depth": df.depth.to_numpy(),
+            "Depth Forecast": forecast[:, 1],
+            "Region": df.region.to_numpy(),
+            "Latitude": latitude,
+            "Longitude": longitude,
         }
     )
-    date = pd.Timestamp.now() - pd.Timedelta(days=7)
-    return df.loc[df.Date >= date]